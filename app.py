@@ -1,5 +1,8 @@
+import math
+import os
 import re
-import copy
+import sys
+from concurrent.futures import ProcessPoolExecutor
 from io import BytesIO
 from typing import Dict, Tuple, List, Optional
 
@@ -7,11 +10,15 @@ import pandas as pd
 import streamlit as st
 import openpyxl
 from openpyxl.worksheet.worksheet import Worksheet
+from python_calamine import CalamineWorkbook
 
 
 # =========================
 # Helpers
 # =========================
+_DIGIT_RE = re.compile(r"\d+")
+
+
 def _norm_str(x) -> str:
     if x is None:
         return ""
@@ -40,7 +47,7 @@ def parse_thousands_to_rp(value) -> Optional[int]:
         return int(value) * 1000
 
     if isinstance(value, float):
-        if value != value:  # NaN
+        if math.isnan(value):
             return None
         # Case like 23.699 (float) meaning 23699
         if value < 1000 and abs(value - round(value)) > 1e-9:
@@ -54,14 +61,50 @@ def parse_thousands_to_rp(value) -> Optional[int]:
     if not s:
         return None
 
+    # Fast path: plain digit string ("9300")
+    if s.isdigit():
+        return int(s) * 1000
+
     # Keep digits only (handles "23.699" or "23,699" or "Rp 23.699")
-    digits = re.findall(r"\d+", s)
+    digits = _DIGIT_RE.findall(s)
     if not digits:
         return None
     thousands = int("".join(digits))
     return thousands * 1000
 
 
+def _parse_thousands_int(value) -> Optional[int]:
+    """parse_thousands_to_rp specialized for all-int columns."""
+    if type(value) is int:
+        return value * 1000
+    return parse_thousands_to_rp(value)
+
+
+def _parse_thousands_float(value) -> Optional[int]:
+    """parse_thousands_to_rp specialized for all-float columns."""
+    if type(value) is float:
+        if math.isnan(value):
+            return None
+        if value < 1000 and abs(value - round(value)) > 1e-9:
+            return int(round(value * 1000)) * 1000
+        return int(round(value)) * 1000
+    return parse_thousands_to_rp(value)
+
+
+def choose_thousands_parser(first_value):
+    """
+    Price columns are typically a single type; pick a parser specialized for it
+    from the first non-None value. The specialized parsers fall back to the
+    general one for stray off-type cells, so mixed columns still parse right.
+    """
+    t = type(first_value)
+    if t is int:
+        return _parse_thousands_int
+    if t is float:
+        return _parse_thousands_float
+    return parse_thousands_to_rp
+
+
 def parse_rp(value) -> Optional[int]:
     """Parse value in mass update price column (usually already full rupiah)."""
     if value is None:
@@ -71,26 +114,64 @@ def parse_rp(value) -> Optional[int]:
     if isinstance(value, int):
         return int(value)
     if isinstance(value, float):
-        if value != value:
+        if math.isnan(value):
             return None
         return int(round(value))
 
     s = _norm_str(value)
     if not s:
         return None
-    digits = re.findall(r"\d+", s)
+    if s.isdigit():
+        return int(s)
+    digits = _DIGIT_RE.findall(s)
     if not digits:
         return None
     return int("".join(digits))
 
 
+def load_sheet_rows(b: bytes) -> List[tuple]:
+    """
+    Read all cell values from the first sheet of an XLSX via calamine (Rust reader,
+    5-20x faster than openpyxl for value-only reads).
+    Returns list of row tuples, 1:1 with sheet rows (row 1 == index 0).
+    Empty cells come back as None (calamine yields "" — normalize to match openpyxl).
+    """
+    sheet = CalamineWorkbook.from_filelike(BytesIO(b)).get_sheet_by_index(0)
+    return [
+        tuple(None if v == "" else v for v in row)
+        for row in sheet.to_python(skip_empty_area=False)
+    ]
+
+
+# Stop scanning after this many consecutive blank key cells: sheets with stray
+# formatting can report an inflated used range (up to the full 1,048,576 rows)
+BLANK_STREAK_LIMIT = 200
+
+
+def trim_after_blank_streak(rows: List[tuple], key_col: int, streak: int = BLANK_STREAK_LIMIT) -> List[tuple]:
+    """
+    Cut the row list at the first run of `streak` consecutive rows whose key
+    column is blank — everything past that is formatting noise, not data.
+    """
+    blank_streak = 0
+    for i, row in enumerate(rows):
+        v = row[key_col - 1] if len(row) >= key_col else None
+        if _norm_str(v):
+            blank_streak = 0
+        else:
+            blank_streak += 1
+            if blank_streak >= streak:
+                return rows[: i + 1 - streak]
+    return rows
+
+
 def find_header_row(
-    ws: Worksheet,
+    rows: List[tuple],
     must_have_any: List[List[str]],
     scan_rows: int = 50,
 ) -> Optional[int]:
     """
-    Scan first N rows, return first row index that satisfies:
+    Scan first N rows, return first row index (1-based) that satisfies:
     - for each group in must_have_any: at least 1 keyword in that group appears in row (case-insensitive).
     Example:
       must_have_any = [
@@ -98,8 +179,8 @@ def find_header_row(
          ["M4"]
       ]
     """
-    for r in range(1, min(scan_rows, ws.max_row) + 1):
-        row_vals = [(_norm_str(ws.cell(r, c).value)).upper() for c in range(1, ws.max_column + 1)]
+    for r, row in enumerate(rows[:scan_rows], start=1):
+        row_vals = [(_norm_str(v)).upper() for v in row]
         row_text = " | ".join(row_vals)
 
         ok = True
@@ -112,11 +193,10 @@ def find_header_row(
     return None
 
 
-def map_headers(ws: Worksheet, header_row: int) -> Dict[str, int]:
-    """Return dict: normalized header -> column index."""
+def map_headers(rows: List[tuple], header_row: int) -> Dict[str, int]:
+    """Return dict: normalized header -> column index (1-based)."""
     headers = {}
-    for c in range(1, ws.max_column + 1):
-        v = ws.cell(header_row, c).value
+    for c, v in enumerate(rows[header_row - 1], start=1):
         key = _norm_key(v)
         if key:
             headers[key] = c
@@ -127,54 +207,51 @@ def get_first_sheet(wb: openpyxl.Workbook) -> Worksheet:
     return wb[wb.sheetnames[0]]
 
 
-def split_sku_addons(sku_full: str) -> Tuple[str, List[str]]:
+def build_style_cache(src_cells: List) -> List:
     """
-    "BASE+PC+BA" => ("BASE", ["PC","BA"])
-    empty addon => []
+    Snapshot the template cells' StyleArrays once. Template and output live in
+    the SAME workbook (the first mass file), so the arrays' indices into the
+    style tables stay valid and one shared reference per column carries the full
+    style (font/fill/border/number_format/alignment/protection).
     """
-    parts = [p for p in sku_full.split("+") if p.strip() != ""]
-    if not parts:
-        return "", []
-    base = parts[0].strip()
-    addons = [p.strip() for p in parts[1:]]
-    return base, addons
-
-
-def copy_row_style(src_ws: Worksheet, src_row: int, dst_ws: Worksheet, dst_row: int, max_col: int):
-    """Copy cell style (font/fill/border/number_format/alignment/protection) from src_row to dst_row."""
-    for c in range(1, max_col + 1):
-        src_cell = src_ws.cell(src_row, c)
+    return [c._style for c in src_cells]
+
+
+def write_styled_row(style_cache: List, dst_ws: Worksheet, dst_row: int, row_values: List):
+    """Write one output row: cached style + value per cell in a single pass."""
+    n = len(row_values)
+    for c, style in enumerate(style_cache, start=1):
         dst_cell = dst_ws.cell(dst_row, c)
-        dst_cell._style = copy.copy(src_cell._style)
-        dst_cell.number_format = src_cell.number_format
-        dst_cell.font = copy.copy(src_cell.font)
-        dst_cell.fill = copy.copy(src_cell.fill)
-        dst_cell.border = copy.copy(src_cell.border)
-        dst_cell.alignment = copy.copy(src_cell.alignment)
-        dst_cell.protection = copy.copy(src_cell.protection)
+        dst_cell._style = style
+        if c <= n:
+            v = row_values[c - 1]
+            if v is not None:
+                dst_cell.value = v
 
 
 # =========================
 # Core processing
 # =========================
+@st.cache_data(show_spinner=False)
 def load_pricelist_map(pl_bytes: bytes) -> Tuple[Dict[str, int], int]:
     """
+    Cached on the file bytes: Streamlit reruns the whole script on every widget
+    interaction, and re-parsing a multi-MB pricelist each time is wasted work.
     Returns:
       pl_map: {KODEBARANG -> price_rp_from_M4}
       header_row
     """
-    wb = openpyxl.load_workbook(BytesIO(pl_bytes), data_only=True)
-    ws = get_first_sheet(wb)
+    rows = load_sheet_rows(pl_bytes)
 
     header_row = find_header_row(
-        ws,
+        rows,
         must_have_any=[["KODEBARANG", "KODE BARANG"], ["M4"]],
         scan_rows=80,
     )
     if not header_row:
         raise ValueError("Header Pricelist tidak ketemu. Pastikan ada kolom KODEBARANG & M4.")
 
-    hdr = map_headers(ws, header_row)
+    hdr = map_headers(rows, header_row)
     # Must have KODEBARANG
     sku_col = hdr.get("KODEBARANG") or hdr.get("KODE BARANG")
     m4_col = hdr.get("M4")
@@ -183,44 +260,52 @@ def load_pricelist_map(pl_bytes: bytes) -> Tuple[Dict[str, int], int]:
 
     pl_map: Dict[str, int] = {}
 
-    for r in range(header_row + 1, ws.max_row + 1):
-        sku = ws.cell(r, sku_col).value
+    parse_price = None  # bound to a dtype-specialized parser at the first value
+    for row in trim_after_blank_streak(rows[header_row:], sku_col):
+        sku = row[sku_col - 1] if len(row) >= sku_col else None
         if sku is None:
             continue
         sku_key = _norm_key(sku)
         if not sku_key or sku_key == "TOTAL":
             continue
-        price_raw = ws.cell(r, m4_col).value
-        price_rp = parse_thousands_to_rp(price_raw)
+        price_raw = row[m4_col - 1] if len(row) >= m4_col else None
+        if price_raw is None:
+            continue
+        if parse_price is None:
+            parse_price = choose_thousands_parser(price_raw)
+        price_rp = parse_price(price_raw)
         if price_rp is None:
             continue
-        pl_map[sku_key] = price_rp
+        # intern: SKU keys are hashed on every map lookup, cached hash + identity
+        # comparison make those lookups cheaper
+        pl_map[sys.intern(sku_key)] = price_rp
 
     if not pl_map:
         raise ValueError("Pricelist kebaca, tapi mapping KODEBARANG -> M4 kosong. Cek isi file Pricelist.")
     return pl_map, header_row
 
 
+@st.cache_data(show_spinner=False)
 def load_addon_map(addon_bytes: bytes) -> Dict[str, int]:
     """
+    Cached on the file bytes (same reasoning as load_pricelist_map).
     Addon file expected to have a code column and a price column.
     Auto-detect columns by keywords:
       - code: contains "ADDON", "KODE", "VARIAN", "STANDARISASI"
       - price: contains "HARGA", "PRICE"
     Return: {ADDON_CODE -> addon_price_rp}
     """
-    wb = openpyxl.load_workbook(BytesIO(addon_bytes), data_only=True)
-    ws = get_first_sheet(wb)
+    rows = load_sheet_rows(addon_bytes)
 
     header_row = find_header_row(
-        ws,
+        rows,
         must_have_any=[["HARGA", "PRICE"], ["KODE", "VARIAN", "STANDARISASI", "ADDON"]],
         scan_rows=80,
     )
     if not header_row:
         raise ValueError("Header Addon Mapping tidak ketemu. Pastikan ada kolom kode addon & harga.")
 
-    hdr = map_headers(ws, header_row)
+    hdr = map_headers(rows, header_row)
 
     # find price col
     price_col = None
@@ -255,60 +340,99 @@ def load_addon_map(addon_bytes: bytes) -> Dict[str, int]:
         raise ValueError("Kolom addon_code / harga tidak ketemu di Addon Mapping.")
 
     addon_map: Dict[str, int] = {}
-    for r in range(header_row + 1, ws.max_row + 1):
-        code = ws.cell(r, code_col).value
+    parse_price = None  # bound to a dtype-specialized parser at the first value
+    for row in trim_after_blank_streak(rows[header_row:], code_col):
+        code = row[code_col - 1] if len(row) >= code_col else None
         if code is None:
             continue
         code_key = _norm_key(code)
         if not code_key:
             continue
 
-        price_raw = ws.cell(r, price_col).value
-        price_rp = parse_thousands_to_rp(price_raw)
+        price_raw = row[price_col - 1] if len(row) >= price_col else None
+        if price_raw is None:
+            continue
+        if parse_price is None:
+            parse_price = choose_thousands_parser(price_raw)
+        price_rp = parse_price(price_raw)
         if price_rp is None:
             continue
 
-        addon_map[code_key] = price_rp
+        addon_map[sys.intern(code_key)] = price_rp
 
     # It's ok if empty, user might upload none/blank
     return addon_map
 
 
-def compute_final_price(
-    sku_full: str,
+# Shopee template: header row 3, data starts row 7
+DATA_START_ROW = 7
+# Columns fixed by template position: SKU col F (6), price col G (7)
+SKU_COL = 6
+PRICE_COL = 7
+
+
+def compute_file_updates(
+    fbytes: bytes,
     pricelist_map: Dict[str, int],
     addon_map: Dict[str, int],
     diskon_rp: int,
-) -> Optional[int]:
+) -> List[Tuple[tuple, int]]:
     """
-    Rules:
+    Compute new prices for one mass file, vectorized with pandas.
+    Rules (same as before):
     - Base SKU must exist in pricelist_map (KODEBARANG)
-    - If addons exist:
-        * EVERY addon must exist in addon_map
-        * else return None (means DO NOT UPDATE)
-    - Final = base + sum(addons) - diskon_rp
+    - If addons exist: EVERY addon must exist in addon_map, else DO NOT UPDATE
+    - Final = base + sum(addons) - diskon_rp (floored at 0)
+    Returns: list of output row values (price column already replaced) for rows
+    whose price actually changes.
     """
-    base, addons = split_sku_addons(sku_full)
-    base_key = _norm_key(base)
-    if not base_key or base_key not in pricelist_map:
-        return None
+    data_rows = trim_after_blank_streak(load_sheet_rows(fbytes)[DATA_START_ROW - 1:], SKU_COL)
+    if not data_rows:
+        return []
 
-    base_price = pricelist_map[base_key]
-    addon_sum = 0
+    sku = pd.Series(
+        [_norm_str(row[SKU_COL - 1] if len(row) >= SKU_COL else None) for row in data_rows]
+    )
 
-    for a in addons:
-        akey = _norm_key(a)
-        if not akey:
+    # Upper-case the whole SKU once; individual parts only need stripping after split.
+    # partition instead of split: most SKUs have no addon, and those rows skip the
+    # explode machinery below entirely.
+    parted = sku.str.upper().str.partition("+")
+    base = parted[0].str.strip()
+    base_price = base.map(pricelist_map)
+    has_addon = parted[1] == "+"
+
+    # Explode addons (rows with a "+" only), map each against addon_map, sum per row.
+    # A row with any unmapped addon must not be updated (STRICT rule).
+    addons = parted[2][has_addon].str.split("+").explode().str.strip()
+    addons = addons[addons.notna() & (addons != "")]
+    addon_price = addons.map(addon_map)
+    addon_missing = addon_price.isna().groupby(level=0).any()
+    addon_sum = addon_price.groupby(level=0).sum()
+
+    addon_missing = addon_missing.reindex(sku.index, fill_value=False)
+    addon_sum = addon_sum.reindex(sku.index, fill_value=0)
+
+    valid = base_price.notna() & ~addon_missing
+    new_price = (base_price.fillna(0) + addon_sum - int(diskon_rp)).clip(lower=0)
+
+    updates: List[list] = []
+    for i in valid[valid].index:
+        row = data_rows[i]
+        new_rp = int(new_price.iat[i])
+
+        # Only output rows where price actually changes (or old is empty)
+        old_price_rp = parse_rp(row[PRICE_COL - 1] if len(row) >= PRICE_COL else None)
+        if old_price_rp is not None and int(old_price_rp) == new_rp:
             continue
-        if akey not in addon_map:
-            # STRICT: if one missing => no change
-            return None
-        addon_sum += addon_map[akey]
 
-    final_price = base_price + addon_sum - int(diskon_rp)
-    if final_price < 0:
-        final_price = 0
-    return final_price
+        # Buffer the full output row with the new price already in place
+        row_values = list(row)
+        if len(row_values) < PRICE_COL:
+            row_values.extend([None] * (PRICE_COL - len(row_values)))
+        row_values[PRICE_COL - 1] = new_rp
+        updates.append(row_values)
+    return updates
 
 
 def process_shopee_files(
@@ -334,73 +458,58 @@ def process_shopee_files(
     out_wb = openpyxl.load_workbook(BytesIO(first_bytes))
     out_ws = get_first_sheet(out_wb)
 
-    # Shopee template: header row 3, data starts row 7
-    DATA_START_ROW = 7
-    # Determine columns by fixed position (as requested): SKU col F (6), price col G (7)
-    SKU_COL = 6
-    PRICE_COL = 7
-
-    # Clear existing data rows (delete from row 7 to end)
-    if out_ws.max_row >= DATA_START_ROW:
-        out_ws.delete_rows(DATA_START_ROW, out_ws.max_row - DATA_START_ROW + 1)
-
-    # Capture style template from row 7 of the original first file (we reload to read style)
-    tmp_wb = openpyxl.load_workbook(BytesIO(first_bytes))
-    tmp_ws = get_first_sheet(tmp_wb)
+    # Capture style template from row 7 BEFORE clearing, so we don't need to load
+    # the first file a second time just to read styles
     template_style_row = DATA_START_ROW  # row 7 contains first data row in template file
-    max_col = tmp_ws.max_column
-
-    write_row = DATA_START_ROW
-    total_updated = 0
-
-    for fname, fbytes in mass_files:
-        try:
-            wb = openpyxl.load_workbook(BytesIO(fbytes))
-            ws = get_first_sheet(wb)
-
-            # iterate rows from 7 onward until blank SKU for a while
-            for r in range(DATA_START_ROW, ws.max_row + 1):
-                sku_full = ws.cell(r, SKU_COL).value
-                sku_full_s = _norm_str(sku_full)
-                if not sku_full_s:
-                    continue
-
-                old_price = ws.cell(r, PRICE_COL).value
-                old_price_rp = parse_rp(old_price)
-
-                new_price = compute_final_price(
-                    sku_full=sku_full_s,
-                    pricelist_map=pricelist_map,
-                    addon_map=addon_map,
-                    diskon_rp=diskon_rp,
+    max_col = out_ws.max_column
+    style_tpl = [out_ws.cell(template_style_row, c) for c in range(1, max_col + 1)]
+    style_cache = build_style_cache(style_tpl)
+
+    # Clear existing data rows (row 7 to end). delete_rows reshuffles every
+    # downstream cell (O(rows x cols)); we only keep the header block, so
+    # dropping the data cells straight from the coordinate dict is O(cells)
+    out_ws._cells = {coord: cell for coord, cell in out_ws._cells.items() if cell.row < DATA_START_ROW}
+    for r in [r for r in out_ws.row_dimensions if r >= DATA_START_ROW]:
+        del out_ws.row_dimensions[r]
+    out_ws._current_row = DATA_START_ROW - 1
+
+    # Compute first, write later: accumulate accepted rows, then stream them
+    # into the template in one sequential pass
+    pending: List[list] = []  # output row values, price column already replaced
+
+    # Files are independent (read-only maps, no shared state), so fan the
+    # XLSX parse + compute out over a process pool when there are several
+    if len(mass_files) > 1:
+        max_workers = min(len(mass_files), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                (fname, executor.submit(compute_file_updates, fbytes, pricelist_map, addon_map, diskon_rp))
+                for fname, fbytes in mass_files
+            ]
+            for fname, fut in futures:
+                try:
+                    pending.extend(fut.result())
+                except Exception as e:
+                    issues.append(
+                        {"file": fname, "row": "", "sku_full": "", "base_sku": "", "reason": f"Gagal proses file: {e}"}
+                    )
+    else:
+        for fname, fbytes in mass_files:
+            try:
+                pending.extend(compute_file_updates(fbytes, pricelist_map, addon_map, diskon_rp))
+            except Exception as e:
+                issues.append(
+                    {"file": fname, "row": "", "sku_full": "", "base_sku": "", "reason": f"Gagal proses file: {e}"}
                 )
 
-                if new_price is None:
-                    # Not updated: either base not in PL or addon missing -> skip
-                    continue
-
-                # Only output rows where price actually changes (or old is empty)
-                if old_price_rp is not None and int(old_price_rp) == int(new_price):
-                    continue
-
-                # Write a styled row into output template
-                out_ws.insert_rows(write_row, 1)
-                copy_row_style(tmp_ws, template_style_row, out_ws, write_row, max_col)
-
-                # Copy entire row values from source file to output row
-                for c in range(1, max_col + 1):
-                    out_ws.cell(write_row, c).value = ws.cell(r, c).value
-
-                # Overwrite price cell only
-                out_ws.cell(write_row, PRICE_COL).value = int(new_price)
-
-                total_updated += 1
-                write_row += 1
+    # Stream the accepted rows into the output template (sequential append:
+    # rows below DATA_START_ROW were cleared, so no insert/shift needed)
+    write_row = DATA_START_ROW
+    for row_values in pending:
+        write_styled_row(style_cache, out_ws, write_row, row_values)
+        write_row += 1
 
-        except Exception as e:
-            issues.append(
-                {"file": fname, "row": "", "sku_full": "", "base_sku": "", "reason": f"Gagal proses file: {e}"}
-            )
+    total_updated = len(pending)
 
     if total_updated == 0:
         issues.append(